@@ -12,52 +12,15 @@ def incrementTimeStamp(timestamp_str, seconds_to_add):
         str: The updated timestamp string in the original format
     """
     # Check if the input is a full header or just the timestamp
-    if timestamp_str.startswith('[') and ']' in timestamp_str:
-        # It's a full header like "[8/6/24, 2:37:02 AM] James:"
-        header_pattern = r'^\[([^]]+)\] ([^:]+):'
-        match = re.match(header_pattern, timestamp_str)
-        
-        if not match:
-            raise ValueError("Header format not recognized")
-        
-        # Extract just the timestamp part and the name
-        timestamp_part = match.group(1)
-        name_part = match.group(2)
-    else:
-        # It's just the timestamp part
-        timestamp_part = timestamp_str
-        name_part = None
-    
-    try:
-        # Parse the datetime from the timestamp part (e.g., "8/6/24, 2:37:02 AM")
-        dt = datetime.datetime.strptime(timestamp_part, "%m/%d/%y, %I:%M:%S %p")
-    except ValueError:
-        # Try alternative format if the first one fails
-        try:
-            dt = datetime.datetime.strptime(timestamp_part, "%m/%d/%Y, %I:%M:%S %p")
-        except ValueError as e:
-            raise ValueError(f"Could not parse timestamp format: {e}")
+    timestamp_part, name_part = _parse_header(timestamp_str)
     
     # Add the specified number of seconds
-    dt = dt + datetime.timedelta(seconds=seconds_to_add)
-    
-    # Format back to the original format with custom formatting
-    # Month and day without leading zeros, hour without leading zero but with AM/PM
-    # Minutes and seconds with leading zeros
-    try:
-        # Use strftime with format codes for removing leading zeros
-        # This works on Linux/Mac
-        new_timestamp_part = dt.strftime("%-m/%-d/%y, %-I:%M:%S %p")
-    except ValueError:
-        # Windows doesn't support the dash prefix, so we need a workaround
-        month = dt.strftime("%m").lstrip('0')
-        day = dt.strftime("%d").lstrip('0')
-        year = dt.strftime("%y")
-        hour = dt.strftime("%I").lstrip('0')
-        minute = dt.strftime("%M")
-        second = dt.strftime("%S")
-        am_pm = dt.strftime("%p")
-        new_timestamp_part = f"{month}/{day}/{year}, {hour}:{minute}:{second} {am_pm}"
+    if 0 <= seconds_to_add < len(_TD_CACHE):
+        delta = _TD_CACHE[seconds_to_add]
+    else:
+        delta = datetime.timedelta(seconds=seconds_to_add)
+    dt = _parse_ts(timestamp_part) + delta
+    new_timestamp_part = _format_ts(dt)
     
     # Return in the same format as the input
     if name_part:
@@ -75,75 +38,51 @@ def uniquify_chat_headers(chat_content):
     Returns:
         str: The processed chat content with unique timestamps
     """
-    # The regex pattern to identify WhatsApp message headers AND extract timestamp and name
-    # This captures the entire header in group 1, timestamp in group 2, and name in group 3
-    header_pattern = r'(^\[([^]]+)\] ([^:]+):)'
+    # Pre-processing: Strip all LRM characters from the entire file
+    chat_content = chat_content.replace('\u200e', '')
     
-    # Split into lines
-    lines = chat_content.splitlines()
+    # Track every (start, end) offset of each header in the content
+    header_spans = defaultdict(list)  # {header: [spans]}
     
-    # Track headers and their line numbers
-    headers_found = {}  # {header: line_number}
-    duplicate_headers = {}  # {header: [line_numbers_of_duplicates]}
+    # First pass: identify all headers
+    for match in _HEADER_LINE_RE.finditer(chat_content):
+        # Key combines timestamp and sender
+        header_spans[(match.group(1), match.group(2))].append(match.span())
     
-    # Pre-processing: Strip all LRM characters from the entire file
-    for line_num, line in enumerate(lines):
-        clean_line = line.replace('\u200e', '')
-        lines[line_num] = clean_line
-    
-    # First pass: identify all headers and duplicates
-    for line_num, line in enumerate(lines):
-        match = re.search(header_pattern, line)
-        if match:
-            full_header = match.group(1)
-            timestamp = match.group(2)
-            sender = match.group(3)
-            
-            # Create a key that combines timestamp and sender
-            key = (timestamp, sender)
-            
-            if key in headers_found:
-                # This is a duplicate header
-                if key not in duplicate_headers:
-                    # First duplicate found, add the original occurrence to the array
-                    duplicate_headers[key] = [headers_found[key]]
-                
-                # Add this duplicate occurrence
-                duplicate_headers[key].append(line_num)
-            else:
-                # First time seeing this header
-                headers_found[key] = line_num
+    # Headers seen more than once are duplicates
+    duplicate_headers = {key: spans for key, spans in header_spans.items() if len(spans) > 1}
     
     # Print summary of duplicates found
-    total_duplicates = sum(len(lines_num) - 1 for lines_num in duplicate_headers.values())
+    total_duplicates = sum(len(spans) - 1 for spans in duplicate_headers.values())
     print(f"Found {len(duplicate_headers)} unique headers with duplicates, totaling {total_duplicates} duplicate instances.")
     
-    # Second pass: process and update duplicates
-    modified_lines = lines.copy()
+    # Second pass: work out the replacement header for each duplicate
+    replacements = {}  # {start: (end, new_header)}
     
-    for (timestamp, sender), line_numbers in duplicate_headers.items():
-        # Original header format from the timestamp and sender
-        original_header_format = f"[{timestamp}] {sender}:"
-        
+    for (timestamp, sender), spans in duplicate_headers.items():
         # Process duplicates in order (skip the first occurrence as it stays unchanged)
-        for i, line_num in enumerate(line_numbers[1:], 1):
-            # Current line contains a duplicate that needs updating
-            current_line = modified_lines[line_num]
-            
+        for i, (start, end) in enumerate(spans[1:], 1):
             try:
                 # Increment just the timestamp part
                 new_timestamp = incrementTimeStamp(timestamp, i)
                 
                 # Create new header with the incremented timestamp
-                new_header = f"[{new_timestamp}] {sender}:"
-                
-                # Replace just the header part of the line, preserving the rest
-                modified_lines[line_num] = current_line.replace(original_header_format, new_header, 1)
+                replacements[start] = (end, f"[{new_timestamp}] {sender}:")
             except ValueError as e:
+                line_num = chat_content.count('\n', 0, start)
                 print(f"Warning: Could not process header on line {line_num + 1}: {e}")
     
-    # Join the lines back into a single string
-    return '\n'.join(modified_lines)#!/usr/bin/env python3
+    # Rebuild the content, splicing in the new headers and keeping everything else as-is
+    parts = []
+    prev = 0
+    for start in sorted(replacements):
+        end, new_header = replacements[start]
+        parts.append(chat_content[prev:start])
+        parts.append(new_header)
+        prev = end
+    parts.append(chat_content[prev:])
+    
+    return ''.join(parts)#!/usr/bin/env python3
 """
 WhatsApp Chat Archive to HTML Converter
 
@@ -157,8 +96,92 @@ import re
 import zipfile
 import shutil
 import datetime
+import functools
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from html import escape
 
+# Precompiled patterns shared by the parsing functions
+# Message header: timestamp in group 1, sender name in group 2
+_HEADER_RE = re.compile(r'^\[([^]]+)\] ([^:]+):')
+
+# Same header pattern, applied to every line of a whole chat file at once
+_HEADER_LINE_RE = re.compile(r'^\[([^]\r\n]+)\] ([^:\r\n]+):', re.MULTILINE)
+
+# Bracketed message timestamp: date in group 1, time in group 2
+_TS_PATTERN = r'\[(\d{1,2}/\d{1,2}/\d{2,4}),\s+(\d{1,2}:\d{2}(?::\d{2})?(?:\s*[AP]M)?)\]'
+
+# A line starting a new message: [date, time] and whitespace, then either a sender
+# before a colon (user) or no colon at all (system); anything else, such as
+# "[date, time] :text", is a continuation line
+_MSG_START_RE = re.compile(r'^' + _TS_PATTERN + r'(?=\s+.+?:|\s+(?!.*?:))\s+')
+
+# Embedded message headers that might appear within content, sender in group 3
+_EMBED_RE = re.compile(_TS_PATTERN + r'\s+(.+?):')
+
+# Media attachment references in message content
+_ATTACHED_RE = re.compile(r'<attached: (.+?)>')
+
+# WhatsApp markdown: *bold*, _italic_, ~strikethrough~, ```monospace``` and URLs
+_MD_RE = re.compile(r'(\*.*?\*)|(_.*?_)|(~.*?~)|(```.*?```)|(https?://[^\s]+)')
+_MD_TAGS = {1: 'strong', 2: 'em', 3: 'del', 4: 'code'}
+
+# Consecutive empty paragraphs in formatted content
+_EMPTY_PARAS_RE = re.compile(r'<p>&nbsp;</p>\s*<p>&nbsp;</p>')
+
+# Prebuilt offsets covering realistic numbers of same-second duplicates
+_TD_CACHE = [datetime.timedelta(seconds=i) for i in range(256)]
+
+# YYYYMMDD date embedded in media filenames (e.g., IMG-20250329-WA0001.jpg)
+_DATE8_RE = re.compile(r'\d{8}')
+
+# Day ordinal of 1970-01-01, for the data-ts seconds-since-epoch values of date dividers
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+# Maps the Unicode and non-breaking spaces found in exported times to plain spaces
+_SPACE_TRANS = str.maketrans({c: ' ' for c in '\u202f\u00a0\u2007\u2002\u2003\u2009'})
+
+@functools.lru_cache(maxsize=4096)
+def _parse_header(timestamp_str):
+    """Split a "[timestamp] Name:" header into (timestamp, name); plain timestamps give (timestamp, None)."""
+    if timestamp_str.startswith('[') and ']' in timestamp_str:
+        # It's a full header like "[8/6/24, 2:37:02 AM] James:"
+        match = _HEADER_RE.match(timestamp_str)
+        
+        if not match:
+            raise ValueError("Header format not recognized")
+        
+        # Extract just the timestamp part and the name
+        return match.group(1), match.group(2)
+    
+    # It's just the timestamp part
+    return timestamp_str, None
+
+@functools.lru_cache(maxsize=4096)
+def _parse_ts(timestamp_part):
+    """Parse a header timestamp like "8/6/24, 2:37:02 AM" into a datetime."""
+    try:
+        return datetime.datetime.strptime(timestamp_part, "%m/%d/%y, %I:%M:%S %p")
+    except ValueError:
+        # Try alternative format if the first one fails
+        try:
+            return datetime.datetime.strptime(timestamp_part, "%m/%d/%Y, %I:%M:%S %p")
+        except ValueError as e:
+            raise ValueError(f"Could not parse timestamp format: {e}")
+
+def _format_ts(dt):
+    """Format a datetime back into the header timestamp format."""
+    # Month and day without leading zeros, hour without leading zero but with AM/PM
+    # Minutes and seconds with leading zeros
+    hour = dt.hour % 12 or 12
+    am_pm = 'AM' if dt.hour < 12 else 'PM'
+    return f"{dt.month}/{dt.day}/{dt.year % 100:02d}, {hour}:{dt.minute:02d}:{dt.second:02d} {am_pm}"
+
+@functools.lru_cache(maxsize=4096)
+def _parse_file_date(date_str):
+    """Convert a YYYYMMDD string from a media filename to a date."""
+    return datetime.datetime.strptime(date_str, '%Y%m%d').date()
+
 def validate_zip(zip_path):
     """Validate that the provided file is a valid WhatsApp chat archive zip."""
     if not os.path.exists(zip_path):
@@ -181,67 +204,61 @@ def validate_zip(zip_path):
     
     return True
 
+class Message:
+    """A single parsed chat message."""
+    __slots__ = (
+        'line_number', 'content_lines', 'is_system', 'is_deleted', 'is_edited',
+        'sender', 'date_str', 'time_str', 'timestamp', 'timestamp_str', 'media', 'content', 'message_id'
+    )
+    
+    def __init__(self, line_number, sender=None, date_str=None, time_str=None, timestamp=None):
+        self.line_number = line_number
+        self.content_lines = []
+        self.is_system = False
+        self.is_deleted = False
+        self.is_edited = False
+        self.sender = sender
+        self.date_str = date_str
+        self.time_str = time_str
+        self.timestamp = timestamp
+        self.timestamp_str = None
+        self.media = None
+        self.content = ''
+        self.message_id = None
+
 def parse_chat_line_by_line(chat_content):
     """Parse WhatsApp chat text into structured messages using line-by-line approach."""
-    lines = chat_content.splitlines()
     messages = []
     current_message = None
     
-    # Pattern to detect if a line starts a new message
-    # Looks for [date, time] sender: pattern at start of line
-    new_message_pattern = re.compile(r'^\[\d{1,2}/\d{1,2}/\d{2,4},\s+\d{1,2}:\d{2}(?::\d{2})?(?:\s*[AP]M)?\]\s+.+?:')
-    
-    # Pattern for system messages without a sender and colon
-    system_message_pattern = re.compile(r'^\[\d{1,2}/\d{1,2}/\d{2,4},\s+\d{1,2}:\d{2}(?::\d{2})?(?:\s*[AP]M)?\]\s+(?!.*?:)')
-    
-    # Pattern to detect embedded message headers that might appear within content
-    embedded_header_pattern = re.compile(r'\[\d{1,2}/\d{1,2}/\d{2,4},\s+\d{1,2}:\d{2}(?::\d{2})?(?:\s*[AP]M)?\]\s+.+?:')
-    
-    line_index = 0
-    while line_index < len(lines):
-        line = lines[line_index]
-        line_index += 1
-        
+    for line_index, line in enumerate(chat_content.splitlines(), 1):
         # Skip empty lines
         if not line.strip():
             continue
         
-        # Check if line starts a new message
-        is_new_message = new_message_pattern.match(line) or system_message_pattern.match(line)
+        # Check if line starts a new message (headers always begin with '[' and a digit)
+        header_match = line.startswith('[') and line[1:2].isdigit() and _MSG_START_RE.match(line)
         
-        if is_new_message:
+        if header_match:
             # If we have collected a message, save it
             if current_message:
                 messages.append(current_message)
             
             # Start a new message
-            current_message = {
-                'line_number': line_index,
-                'content_lines': [],
-                'is_system': False,
-                'is_deleted': False,
-                'is_edited': False,
-                'sender': None,
-                'date_str': None,
-                'time_str': None,
-                'timestamp': None,
-                'media': None
-            }
+            current_message = Message(line_index)
             
             # Extract timestamp and sender information
             try:
                 # Extract timestamp [DD/MM/YY, HH:MM:SS AM/PM]
-                timestamp_match = re.match(r'^\[(\d{1,2}/\d{1,2}/\d{2,4}),\s+(\d{1,2}:\d{2}(?::\d{2})?(?:\s*[AP]M)?)\]', line)
-                if timestamp_match:
-                    current_message['date_str'] = timestamp_match.group(1)
-                    current_message['time_str'] = timestamp_match.group(2)
-                    
-                    # Parse timestamp
-                    current_message['timestamp'] = parse_timestamp(
-                        current_message['date_str'], 
-                        current_message['time_str'],
-                        line_index
-                    )
+                current_message.date_str = header_match.group(1)
+                current_message.time_str = header_match.group(2)
+                
+                # Parse timestamp
+                current_message.timestamp = parse_timestamp(
+                    current_message.date_str, 
+                    current_message.time_str,
+                    line_index
+                )
                 
                 # Get everything after the timestamp bracket
                 message_content = line[line.find(']')+1:].strip()
@@ -252,36 +269,36 @@ def parse_chat_line_by_line(chat_content):
                 if ': ' in message_content:
                     # It's a user message
                     sender, content = message_content.split(': ', 1)
-                    current_message['sender'] = sender.strip()
+                    current_message.sender = sender.strip()
                     if content.strip():  # Only add content if not empty
-                        current_message['content_lines'].append(content.strip())
+                        current_message.content_lines.append(content.strip())
                 else:
                     # It's a system message
-                    current_message['is_system'] = True
-                    current_message['sender'] = 'System'
-                    current_message['content_lines'].append(message_content)
+                    current_message.is_system = True
+                    current_message.sender = 'System'
+                    current_message.content_lines.append(message_content)
                     
                     # Check if it's a deleted message
                     if "This message was deleted" in message_content:
-                        current_message['is_deleted'] = True
+                        current_message.is_deleted = True
                         # Try to extract who deleted the message
                         if "This message was deleted by" in message_content:
                             deleted_by = message_content.replace("This message was deleted by", "").strip()
-                            current_message['sender'] = deleted_by
+                            current_message.sender = deleted_by
             
             except Exception as e:
                 print(f"Warning: Could not parse message at line {line_index}: {line}")
                 print(f"Error: {e}")
                 # Still keep a basic version of the message
                 if current_message:
-                    current_message['content_lines'].append(line.strip())
+                    current_message.content_lines.append(line.strip())
         
         else:
             # This might be a continuation of the previous message OR it might contain embedded headers
             if current_message:
                 # Check if this line contains embedded message headers
                 # If so, treat each part as a separate message
-                embedded_headers = list(embedded_header_pattern.finditer(line))
+                embedded_headers = list(_EMBED_RE.finditer(line)) if '[' in line else []
                 
                 if embedded_headers:
                     # Process the line as multiple messages
@@ -289,51 +306,41 @@ def parse_chat_line_by_line(chat_content):
                     
                     # If there's content before the first header, add it to the current message
                     if embedded_headers[0].start() > 0:
-                        current_message['content_lines'].append(line[:embedded_headers[0].start()].strip())
+                        current_message.content_lines.append(line[:embedded_headers[0].start()].strip())
                     
                     # Save the current message
                     messages.append(current_message)
                     
                     # Process each embedded header as a new message
                     for i, match in enumerate(embedded_headers):
-                        header = match.group(0)
-                        
                         # Extract the header part (timestamp and sender)
-                        header_match = re.match(r'\[(\d{1,2}/\d{1,2}/\d{2,4}),\s+(\d{1,2}:\d{2}(?::\d{2})?(?:\s*[AP]M)?)\]\s+(.+?):', header)
+                        date_str, time_str, sender = match.groups()
                         
-                        if header_match:
-                            date_str, time_str, sender = header_match.groups()
-                            
-                            # Create a new message for this header
-                            current_message = {
-                                'line_number': line_index,
-                                'content_lines': [],
-                                'is_system': False,
-                                'is_deleted': False,
-                                'is_edited': False,
-                                'sender': sender.strip(),
-                                'date_str': date_str,
-                                'time_str': time_str,
-                                'timestamp': parse_timestamp(date_str, time_str, line_index),
-                                'media': None
-                            }
-                            
-                            # Add any content after this header and before the next one
-                            content_start = match.end()
-                            content_end = embedded_headers[i+1].start() if i+1 < len(embedded_headers) else len(line)
-                            if content_start < content_end:
-                                content = line[content_start:content_end].strip()
-                                if content:
-                                    current_message['content_lines'].append(content)
-                            
-                            # Save this message
-                            messages.append(current_message)
-                    
+                        # Create a new message for this header
+                        current_message = Message(
+                            line_index,
+                            sender=sender.strip(),
+                            date_str=date_str,
+                            time_str=time_str,
+                            timestamp=parse_timestamp(date_str, time_str, line_index)
+                        )
+                        
+                        # Add any content after this header and before the next one
+                        content_start = match.end()
+                        content_end = embedded_headers[i+1].start() if i+1 < len(embedded_headers) else len(line)
+                        if content_start < content_end:
+                            content = line[content_start:content_end].strip()
+                            if content:
+                                current_message.content_lines.append(content)
+                        
+                        # Save this message
+                        messages.append(current_message)
+                
                     # Start a fresh message for any subsequent lines
                     current_message = None
                 else:
                     # No embedded headers, just a regular continuation line
-                    current_message['content_lines'].append(line)
+                    current_message.content_lines.append(line)
     
     # Don't forget the last message
     if current_message:
@@ -341,83 +348,101 @@ def parse_chat_line_by_line(chat_content):
     
     # Post-processing
     for msg in messages:
-        # Join content lines
-        content = '\n'.join(msg['content_lines']).strip()
+        # Join content lines (most messages have just one)
+        content_lines = msg.content_lines
+        content = content_lines[0] if len(content_lines) == 1 else '\n'.join(content_lines)
+        content = content.strip()
         
         # Check for edited messages
         if " (edited)" in content or " (edited message)" in content:
-            msg['is_edited'] = True
+            msg.is_edited = True
             content = content.replace(" (edited)", "").replace(" (edited message)", "")
         
         # Check for media attachments
-        media_match = re.search(r'<attached: (.+?)>', content)
+        media_match = _ATTACHED_RE.search(content) if '<attached: ' in content else None
         if media_match:
-            msg['media'] = media_match.group(1)
+            msg.media = media_match.group(1)
             # Remove the media reference from the content
-            content = re.sub(r'<attached: .+?>', '', content).strip()
+            content = _ATTACHED_RE.sub('', content).strip()
         
-        msg['content'] = content
+        msg.content = content
+        
+        # Display form of the timestamp, as shown above each message
+        msg.timestamp_str = f"{msg.date_str}, {msg.time_str}" if msg.date_str and msg.time_str else "Unknown time"
     
     return messages
 
+@functools.lru_cache(maxsize=16384)
+def _parse_date_time(date_str, time_str):
+    """Parse "D/M/Y" and "H:MM[:SS] [AM|PM]" strings into a datetime; raises ValueError if invalid."""
+    month, _, rest = date_str.partition('/')
+    day, _, year = rest.partition('/')
+        
+    # Try to handle both date formats sensibly
+    # Assume first number under 13 is month, otherwise it's day
+    # This isn't perfect but works for most cases
+    month = int(month)
+    day = int(day)
+    
+    # If month is larger than 12, swap day and month
+    if month > 12:
+        month, day = day, month
+    
+    # Handle both 2-digit and 4-digit year formats
+    year = int(year)
+    if year < 100:  # 2-digit year
+        year += 2000  # Assume 21st century
+    
+    # Clean up any Unicode spaces and non-breaking spaces
+    clean_time_str = time_str.translate(_SPACE_TRANS)
+    
+    # Handle both 12-hour and 24-hour time formats
+    # The usual shape is "H:MM:SS AM", so check the suffix before searching the string
+    am_pm = clean_time_str[-2:]
+    if am_pm == 'AM' or am_pm == 'PM':
+        clean_time_str = clean_time_str[:-2]
+    elif 'AM' in clean_time_str or 'PM' in clean_time_str:
+        # AM/PM somewhere other than the end
+        am_pm = 'AM' if 'AM' in clean_time_str else 'PM'
+        clean_time_str = clean_time_str.replace('AM', '').replace('PM', '')
+    else:
+        # 24-hour format
+        am_pm = None
+    
+    hour, _, rest = clean_time_str.partition(':')
+    minute, _, second = rest.partition(':')
+    hour = int(hour)
+    minute = int(minute)
+    second = int(second) if second else 0
+    
+    # Adjust hour for PM
+    if am_pm == 'PM' and hour < 12:
+        hour += 12
+    if am_pm == 'AM' and hour == 12:
+        hour = 0
+    
+    return datetime.datetime(year, month, day, hour, minute, second)
+
+# (date_str, time_str) pairs already reported as unparseable
+_bad_timestamps = set()
+
 def parse_timestamp(date_str, time_str, line_number=None):
     """Parse date and time strings into a datetime object."""
+    # Handle various date formats (MM/DD/YY or DD/MM/YY)
+    if date_str.count('/') != 2:
+        print(f"Warning: Invalid date format at line {line_number}: {date_str}")
+        return None
+    
     try:
-        # Handle various date formats (MM/DD/YY or DD/MM/YY)
-        date_parts = date_str.split('/')
-        if len(date_parts) != 3:
-            print(f"Warning: Invalid date format at line {line_number}: {date_str}")
+        # Repeated timestamps are common in chats, so results are cached
+        return _parse_date_time(date_str, time_str)
+    
+    except ValueError as e:
+        # Only warn once for each distinct bad timestamp
+        if (date_str, time_str) in _bad_timestamps:
             return None
-            
-        # Try to handle both date formats sensibly
-        # Assume first number under 13 is month, otherwise it's day
-        # This isn't perfect but works for most cases
-        month = int(date_parts[0])
-        day = int(date_parts[1])
-        
-        # If month is larger than 12, swap day and month
-        if month > 12:
-            month, day = day, month
-        
-        # Handle both 2-digit and 4-digit year formats
-        year = int(date_parts[2])
-        if year < 100:  # 2-digit year
-            year += 2000  # Assume 21st century
-        
-        # Handle both 12-hour and 24-hour time formats with Unicode space handling
-        is_12h_format = 'AM' in time_str or 'PM' in time_str
-        
-        # Clean up any Unicode spaces and non-breaking spaces
-        clean_time_str = time_str
-        for space_char in ['\u202f', '\u00a0', '\u2007', '\u2002', '\u2003', '\u2009']:
-            clean_time_str = clean_time_str.replace(space_char, ' ')
-        
-        if is_12h_format:
-            # 12-hour format (with AM/PM)
-            # Handle AM/PM with various spacing
-            am_pm = 'AM' if 'AM' in clean_time_str else 'PM'
-            clean_time = clean_time_str.replace(' AM', '').replace('AM', '').replace(' PM', '').replace('PM', '').strip()
-            
-            time_parts = clean_time.split(':')
-            hour = int(time_parts[0])
-            minute = int(time_parts[1])
-            second = int(time_parts[2]) if len(time_parts) > 2 else 0
-            
-            # Adjust hour for PM
-            if am_pm == 'PM' and hour < 12:
-                hour += 12
-            if am_pm == 'AM' and hour == 12:
-                hour = 0
-        else:
-            # 24-hour format
-            time_parts = clean_time_str.split(':')
-            hour = int(time_parts[0])
-            minute = int(time_parts[1])
-            second = int(time_parts[2]) if len(time_parts) > 2 else 0
+        _bad_timestamps.add((date_str, time_str))
         
-        return datetime.datetime(year, month, day, hour, minute, second)
-    
-    except (ValueError, IndexError) as e:
         prefix = f"Line {line_number}: " if line_number else ""
         print(f"Warning: {prefix}Could not parse date/time: {date_str}, {time_str}")
         print(f"Error: {e}")
@@ -426,68 +451,75 @@ def parse_timestamp(date_str, time_str, line_number=None):
             print(f"Debug - Time string character codes: {[ord(c) for c in time_str]}")
         return None
 
-def extract_media_files(zip_path, output_dir):
-    """Extract all media files from the zip to the media directory."""
-    media_dir = os.path.join(output_dir, 'media')
-    os.makedirs(media_dir, exist_ok=True)
-    
-    media_files = []
+def _extract_media_batch(zip_path, entries, media_dir, total_files):
+    """Extract (index, zip name, media name) entries from the zip; returns the (index, media name) pairs extracted."""
+    extracted = []
+    # Each worker uses its own handle, ZipFile objects are not thread-safe
     with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        file_list = zip_ref.namelist()
-        total_files = len([f for f in file_list if not f.endswith('/') and not f.endswith('_chat.txt')])
-        
-        print(f"Found {total_files} potential media files in the zip archive")
-        
-        for i, file in enumerate(file_list, 1):
-            # Skip _chat.txt and directories
-            if file.endswith('/') or file.endswith('_chat.txt'):
-                continue
-                
+        for i, file, media_name in entries:
             # Show progress for large archives
             if i % 20 == 0 or i == total_files:
                 print(f"Processing media file {i}/{total_files}: {os.path.basename(file)}")
             
-            # Extract media file
+            # Extract media file straight to its flattened path
             try:
-                zip_ref.extract(file, media_dir)
-                
-                # Move file to media directory if it's in a subdirectory
-                source_path = os.path.join(media_dir, file)
-                target_path = os.path.join(media_dir, os.path.basename(file))
-                
-                if source_path != target_path:
-                    # Create parent directory if it doesn't exist
-                    os.makedirs(os.path.dirname(target_path), exist_ok=True)
-                    try:
-                        shutil.move(source_path, target_path)
-                    except shutil.Error as e:
-                        print(f"Warning: Could not move {source_path} to {target_path}: {e}")
-                        # If file already exists, keep original filename structure
-                        alt_target = os.path.join(media_dir, file.replace('/', '_'))
-                        try:
-                            shutil.move(source_path, alt_target)
-                            print(f"Moved to alternative path: {alt_target}")
-                            media_files.append(file.replace('/', '_'))
-                        except Exception as e2:
-                            print(f"Error: Failed with alternative path too: {e2}")
-                    else:
-                        # Clean up empty directories
-                        dir_path = os.path.dirname(source_path)
-                        try:
-                            while dir_path != media_dir:
-                                if os.path.exists(dir_path) and not os.listdir(dir_path):
-                                    os.rmdir(dir_path)
-                                dir_path = os.path.dirname(dir_path)
-                        except OSError:
-                            pass  # Ignore errors when removing directories
-                        
-                        media_files.append(os.path.basename(file))
-                else:
-                    media_files.append(os.path.basename(file))
-                
+                with zip_ref.open(file) as src, open(os.path.join(media_dir, media_name), 'wb') as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+                extracted.append((i, media_name))
             except Exception as e:
                 print(f"Warning: Could not extract file {file}: {e}")
     
+    return extracted
+
+def extract_media_files(zip_path, output_dir):
+    """Extract all media files from the zip to the media directory."""
+    media_dir = os.path.join(output_dir, 'media')
+    os.makedirs(media_dir, exist_ok=True)
+    
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        file_list = zip_ref.namelist()
+    total_files = len([f for f in file_list if not f.endswith('/') and not f.endswith('_chat.txt')])
+    
+    print(f"Found {total_files} potential media files in the zip archive")
+    
+    # Settle every target name before any work is submitted, so no two workers
+    # ever write the same file; names are compared case-insensitively because
+    # x.jpg and X.JPG are one file on case-insensitive filesystems
+    entries = []
+    used_names = set()  # casefolded target names
+    for i, file in enumerate(file_list, 1):
+        # Skip _chat.txt and directories
+        if file.endswith('/') or file.endswith('_chat.txt'):
+            continue
+        
+        media_name = os.path.basename(file)
+        if media_name.casefold() in used_names:
+            # Name clash: keep both files, the later one under its path with '/' -> '_',
+            # numbered (stem_1.ext, stem_2.ext, ...) if that name is taken as well
+            media_name = file.replace('/', '_')
+            stem, ext = os.path.splitext(media_name)
+            suffix = 1
+            while media_name.casefold() in used_names:
+                media_name = f"{stem}_{suffix}{ext}"
+                suffix += 1
+            print(f"Warning: {os.path.basename(file)} already extracted, using alternative path: {os.path.join(media_dir, media_name)}")
+        used_names.add(media_name.casefold())
+        entries.append((i, file, media_name))
+    
+    # Decompression and disk writes release the GIL, so extract in parallel
+    workers = min(8, os.cpu_count() or 4)
+    extracted = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_extract_media_batch, zip_path, entries[k::workers], media_dir, total_files)
+            for k in range(workers)
+        ]
+        for future in as_completed(futures):
+            extracted.extend(future.result())
+    
+    # Keep the archive order regardless of which worker finished first
+    media_files = [media_name for _, media_name in sorted(extracted)]
+    
     print(f"Successfully extracted {len(media_files)} media files to {media_dir}")
     
     # Print some statistics about media types
@@ -502,11 +534,31 @@ def extract_media_files(zip_path, output_dir):
     
     return media_files
 
+def _format_markdown_match(match):
+    """Replace one WhatsApp markdown match from _MD_RE with its HTML."""
+    group = match.lastindex
+    text = match.group(group)
+    
+    # URLs are linked as-is
+    if group == 5:
+        return f'<a href="{text}" target="_blank">{text}</a>'
+    
+    # Monospace uses ``` delimiters, the others a single character
+    inner = text[3:-3] if group == 4 else text[1:-1]
+    
+    # Format the enclosed text too, so nested markers still work
+    tag = _MD_TAGS[group]
+    return f'<{tag}>{_MD_RE.sub(_format_markdown_match, inner)}</{tag}>'
+
 def format_markdown(text):
     """Format WhatsApp markdown to HTML."""
     if not text:
         return ""
     
+    # Escape the raw text first; the markdown markers are untouched by escaping,
+    # so only the tags added below end up as live HTML
+    text = escape(text)
+    
     # First split the text by newlines
     paragraphs = text.split('\n')
     
@@ -518,21 +570,8 @@ def format_markdown(text):
             formatted_paragraphs.append("&nbsp;")
             continue
             
-        # Bold: *text*
-        paragraph = re.sub(r'\*(.*?)\*', r'<strong>\1</strong>', paragraph)
-        
-        # Italic: _text_
-        paragraph = re.sub(r'_(.*?)_', r'<em>\1</em>', paragraph)
-        
-        # Strikethrough: ~text~
-        paragraph = re.sub(r'~(.*?)~', r'<del>\1</del>', paragraph)
-        
-        # Monospace: ```text```
-        paragraph = re.sub(r'```(.*?)```', r'<code>\1</code>', paragraph)
-        
-        # Handle URLs
-        url_pattern = r'(https?://[^\s]+)'
-        paragraph = re.sub(url_pattern, r'<a href="\1" target="_blank">\1</a>', paragraph)
+        # Bold, italic, strikethrough, monospace and URLs in a single scan
+        paragraph = _MD_RE.sub(_format_markdown_match, paragraph)
         
         formatted_paragraphs.append(paragraph)
     
@@ -540,55 +579,230 @@ def format_markdown(text):
     result = '<p>' + '</p><p>'.join(formatted_paragraphs) + '</p>'
     
     # Clean up any consecutive empty paragraphs
-    result = re.sub(r'<p>&nbsp;</p>\s*<p>&nbsp;</p>', r'<p>&nbsp;</p>', result)
+    result = _EMPTY_PARAS_RE.sub('<p>&nbsp;</p>', result)
     
     return result
 
-def generate_html(messages, media_files, output_file):
-    """Generate HTML file from parsed messages and media files."""
-    # Set of unique senders for the selector
-    senders = set(msg['sender'] for msg in messages if not msg.get('is_system', False))
-    senders_list = sorted(list(senders))
-    
-    # Map media files to timestamps when possible
-    media_map = {}
-    unmatched_count = 0
-    
-    print("Analyzing media files for timestamp matching...")
-    for file in media_files:
-        # Try to extract date from filename (e.g., IMG-20250329-WA0001.jpg)
-        date_match = re.search(r'(\d{8})', file)
-        if date_match:
-            date_str = date_match.group(1)
-            try:
-                # Convert YYYYMMDD to a date object
-                file_date = datetime.datetime.strptime(date_str, '%Y%m%d').date()
-                if file_date not in media_map:
-                    media_map[file_date] = []
-                media_map[file_date].append(file)
-                print(f"Mapped media file {file} to date {file_date}")
-            except ValueError:
-                # If date parsing fails, add to unmatched count
-                unmatched_count += 1
-        else:
-            # No date in filename
-            unmatched_count += 1
-    
-    matched_count = sum(len(files) for files in media_map.values())
-    print(f"Media mapping results: {matched_count} files mapped to dates, {unmatched_count} files without clear date mapping")
-    
-    # Track which media files have been used in the conversation
-    used_media = set()
-    
-    # HTML content
-    html = """<!DOCTYPE html>
+@functools.lru_cache(maxsize=4096)
+def _escape_name(name):
+    """html.escape for sender and media names, which repeat throughout a chat."""
+    return escape(name)
+
+@functools.lru_cache(maxsize=None)
+def _media_extension(media_file):
+    """Return the lowercased extension of a media filename."""
+    return os.path.splitext(media_file)[1].lower()
+
+# Media container fragments for the renderers below
+_IMAGE_TEMPLATE = """
+            <div class="media-container">
+                <img src="media/%s" alt="Media: %s" loading="lazy" decoding="async">
+            </div>
+"""
+_VIDEO_TEMPLATE = """
+            <div class="media-container">
+                <video controls preload="none">
+                    <source src="media/%s" type="video/%s">
+                    Your browser does not support the video tag.
+                </video>
+            </div>
+"""
+_FILE_LINK_TEMPLATE = """
+            <div class="media-container">
+                <a href="media/%s" target="_blank">%s: %s</a>
+            </div>
+"""
+
+def _render_image(media_file, file_extension):
+    """HTML for an image attachment."""
+    return _IMAGE_TEMPLATE % (media_file, media_file)
+
+def _render_video(media_file, file_extension):
+    """HTML for a video attachment."""
+    return _VIDEO_TEMPLATE % (media_file, file_extension[1:])
+
+def _render_file_link(media_file, label):
+    """HTML for any other attachment, as a link to the file."""
+    return _FILE_LINK_TEMPLATE % (media_file, label, _escape_name(media_file))
+
+# Media extension -> renderer for the types shown inline
+_MEDIA_RENDERERS = {
+    '.jpg': _render_image,
+    '.jpeg': _render_image,
+    '.png': _render_image,
+    '.gif': _render_image,
+    '.mp4': _render_video,
+    '.mov': _render_video,
+    '.avi': _render_video,
+    '.3gp': _render_video,
+}
+
+# Per-message HTML fragments, filled with % formatting in write_html
+# Slots: message class, message ID, data-sender attribute, data-media-id attribute,
+# timestamp, sender line, content line, edited line
+_MSG_TEMPLATE = (
+    '\n'
+    '        <div class="message %s" data-message-id="%s"%s%s>\n'
+    '            <div class="timestamp">%s</div>\n'
+    '%s'
+    '%s'
+    '%s'
+)
+_SENDER_ATTR_TEMPLATE = ' data-sender="%s"'
+_MEDIA_ATTR_TEMPLATE = ' data-media-id="%s"'
+_SENDER_TEMPLATE = '            <div class="sender">%s</div>\n'
+_CONTENT_TEMPLATE = '            <div class="content">%s</div>\n'
+_DELETED_CONTENT = '            <div class="content">This message was deleted</div>\n'
+_EDITED_LABEL = '            <div class="edited-label">Edited</div>\n'
+_MSG_CLOSE = '\n        </div>\n'
+# Each day opens a section, headed by its date divider
+# Day slots: data-ts attribute (empty for the undated Additional Media section), divider label
+_DAY_TS_ATTR_TEMPLATE = ' data-ts="%d"'
+_DAY_OPEN_TEMPLATE = (
+    '\n'
+    '        <section class="day"%s>\n'
+    '        <div class="date-divider">\n'
+    '            <span>%s</span>\n'
+    '        </div>\n'
+)
+_DAY_CLOSE = '\n        </section>\n'
+
+# First and last chat day (ISO dates), filling the _HTML_HEAD slot
+_DATE_RANGE_META_TEMPLATE = (
+    '    <meta name="wa-date-min" content="%s">\n'
+    '    <meta name="wa-date-max" content="%s">\n'
+)
+
+# Page header: asset links and the controls panel up to the sender selector options
+# Slot: the date range <meta> tags (empty when no message is dated)
+_HTML_HEAD = """<!DOCTYPE html>
 <html>
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>WhatsApp Chat</title>
-    <style>
-        body {
+    <link rel="stylesheet" href="style.css">
+    <script src="app.js" defer></script>
+%s</head>
+<body>
+    <div id="controls-wrapper" class="controls-wrapper left">
+        <div class="controls">
+            <h2>Chat Controls</h2>
+            <div>
+                <label for="self-selector">Select who you are (messages will appear on the right in green):</label>
+                <select id="self-selector">
+"""
+
+# Rest of the controls panel after the sender options, up to the opening of the chat container
+_HTML_CONTROLS = """                </select>
+            </div>
+            <div class="dock-position">
+                <div class="dock-position-label">Dock Position:</div>
+                <div class="dock-buttons">
+                    <div id="dock-left" class="dock-button active">Left</div>
+                    <div id="dock-right" class="dock-button">Right</div>
+                </div>
+            </div>
+            <div class="about-section">
+                <button id="about-button" class="about-button">About WhatsApp Export</button>
+            </div>
+            <div class="visibility-controls">
+                <h3>Display Options</h3>
+                <div class="toggle-option">
+                    <label for="toggle-dialog">Show Dialog</label>
+                    <label class="switch">
+                        <input type="checkbox" id="toggle-dialog" checked>
+                        <span class="slider round"></span>
+                    </label>
+                </div>
+                <div class="toggle-option">
+                    <label for="toggle-media">Show Media</label>
+                    <label class="switch">
+                        <input type="checkbox" id="toggle-media" checked>
+                        <span class="slider round"></span>
+                    </label>
+                </div>
+                <div class="toggle-option">
+                    <label for="toggle-ids">Show Message IDs</label>
+                    <label class="switch">
+                        <input type="checkbox" id="toggle-ids">
+                        <span class="slider round"></span>
+                    </label>
+                </div>
+            </div>
+            <div class="date-filter-controls">
+                <h3>Date Filter</h3>
+                <div class="date-range">
+                    <label for="date-from">From:</label>
+                    <input type="date" id="date-from">
+                </div>
+                <div class="date-range">
+                    <label for="date-to">To:</label>
+                    <input type="date" id="date-to">
+                </div>
+                <div class="filter-buttons">
+                    <button id="apply-date-filter" class="filter-button apply">Apply Filter</button>
+                    <button id="clear-date-filter" class="filter-button clear">Clear Filter</button>
+                </div>
+            </div>
+        </div>
+        <div id="toggle-button" class="toggle-button">↓</div>
+    </div>
+    <div class="main-content">
+        <div class="chat-container">
+"""
+
+# Sender selector entry, emitted once per participant
+_SENDER_OPTION_TEMPLATE = '                    <option value="%s">%s</option>\n'
+
+# Static page footer: closes the chat container, then the modals
+_HTML_FOOT = """
+    </div>
+    </div>
+    
+    <!-- Image modal -->
+    <div id="imageModal" class="modal">
+        <span class="close">&times;</span>
+        <img class="modal-content" id="modalImg">
+    </div>
+    
+    <!-- About modal -->
+    <div id="aboutModal" class="modal about-modal">
+        <div class="about-modal-content">
+            <span class="close">&times;</span>
+            <h2>About WhatsApp Chat Export</h2>
+            <div class="about-content">
+                <p>This viewer displays a WhatsApp chat that was exported using the "Export Chat" feature in WhatsApp. While it preserves most of the conversation, there are some important limitations to be aware of:</p>
+                
+                <h3>Limitations of WhatsApp Chat Exports</h3>
+                <ul>
+                    <li><strong>Message Replies:</strong> The export does not preserve reply context. When someone replies to a specific message, that connection is lost in the export.</li>
+                    <li><strong>Reactions:</strong> Emoji reactions to messages are not included in the export.</li>
+                    <li><strong>Media Quality:</strong> Images and videos may be compressed or reduced in quality.</li>
+                    <li><strong>Formatting:</strong> Some advanced formatting might not be preserved exactly as it appeared in WhatsApp.</li>
+                    <li><strong>Polls and Interactive Content:</strong> Polls, location sharing, and other interactive content may not export completely.</li>
+                </ul>
+                
+                <h3>What Is Preserved</h3>
+                <ul>
+                    <li>Text messages with timestamps</li>
+                    <li>Basic formatting (bold, italic, strikethrough)</li>
+                    <li>Media files (photos, videos, documents, etc.)</li>
+                    <li>System messages (when someone joined or left)</li>
+                    <li>Information about deleted messages</li>
+                </ul>
+                
+                <p>Due to these limitations, some context in conversations may be lost. This viewer attempts to present the exported chat in the most readable format possible, but cannot restore information that wasn't included in the export.</p>
+            </div>
+        </div>
+    </div>
+    
+</body>
+</html>
+"""
+
+# Page stylesheet, written next to the HTML as style.css
+_PAGE_CSS = """        body {
             font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, Helvetica, Arial, sans-serif;
             margin: 0;
             padding: 0;
@@ -856,11 +1070,8 @@ def generate_html(messages, media_files, output_file):
             background-color: #e1e1e1;
         }
         
-        .message.date-filtered {
-            display: none;
-        }
-        
-        .date-divider.date-filtered {
+        /* Day sections marked by the date filter, hidden while it is active */
+        .chat-container.date-filter-active .day.date-filtered {
             display: none;
         }
         
@@ -926,21 +1137,32 @@ def generate_html(messages, media_files, output_file):
             border-radius: 50%;
         }
         
-        /* Hidden elements */
-        .message.dialog-hidden:not(.has-media) {
+        /* Hidden elements: the toggles set one class on the chat container,
+           the has-/no- content classes are set by the generator */
+        .chat-container.dialog-hidden .message.has-dialog.no-media {
             display: none;
         }
         
-        .message.media-hidden:not(.has-dialog) {
+        .chat-container.media-hidden .message.has-media.no-dialog {
             display: none;
         }
         
-        .chat-container {
+        .chat-container,
+        .day {
             display: flex;
             flex-direction: column;
             gap: 10px;
         }
         
+        /* Offscreen days are skipped as a whole, so long chats only lay out the
+           days near the viewport; the padding keeps the bubble shadows inside the
+           day's paint containment instead of clipped at its edges */
+        .day {
+            content-visibility: auto;
+            contain-intrinsic-size: auto 400px;
+            padding: 0 2px 4px;
+        }
+        
         .message {
             max-width: 75%;
             padding: 10px 15px;
@@ -948,6 +1170,10 @@ def generate_html(messages, media_files, output_file):
             position: relative;
             box-shadow: 0 1px 2px rgba(0, 0, 0, 0.1);
             word-wrap: break-word;
+            /* Skip layout and paint for offscreen messages; the placeholder size
+               is replaced by the real one once a message has been rendered */
+            content-visibility: auto;
+            contain-intrinsic-size: auto 80px;
         }
         
         .message .content {
@@ -963,13 +1189,6 @@ def generate_html(messages, media_files, output_file):
             margin-bottom: 0;
         }
         
-        .sent {
-            align-self: flex-end;
-            background-color: #DCF8C6;
-            margin-right: 10px;
-            border-bottom-right-radius: 5px;
-        }
-        
         .received {
             align-self: flex-start;
             background-color: #FFFFFF;
@@ -978,6 +1197,8 @@ def generate_html(messages, media_files, output_file):
             border-bottom-left-radius: 5px;
         }
         
+        /* The "sent" look for the selected sender is a #self-style rule written by the script */
+        
         .system-message {
             align-self: center;
             background-color: #f8f8f8;
@@ -1007,19 +1228,19 @@ def generate_html(messages, media_files, output_file):
             margin-bottom: 3px;
         }
         
-        .message-id {
+        /* Message and media IDs, drawn from data attributes when "Show Message IDs" is on */
+        .show-ids .message::before {
+            content: "Message: " attr(data-message-id);
+            display: block;
+            white-space: pre-line;
             font-size: 0.75em;
             color: #8E8E93;
             margin-bottom: 2px;
             font-family: monospace;
         }
         
-        .media-id {
-            font-size: 0.7em;
-            color: #8E8E93;
-            margin-bottom: 2px;
-            font-family: monospace;
-            font-style: italic;
+        .show-ids .message[data-media-id]::before {
+            content: "Message: " attr(data-message-id) "\\A" "Media: " attr(data-media-id);
         }
         
         .sender {
@@ -1043,37 +1264,23 @@ def generate_html(messages, media_files, output_file):
             border-radius: 5px;
         }
         
+        /* Date label between two flex-grown rules */
         .date-divider {
-            text-align: center;
+            display: flex;
+            align-items: center;
+            gap: 10px;
             margin: 20px 0;
-            position: relative;
-        }
-        
-        .date-divider::before {
-            content: '';
-            position: absolute;
-            left: 0;
-            top: 50%;
-            width: 40%;
-            height: 1px;
-            background-color: #E5E5EA;
         }
         
+        .date-divider::before,
         .date-divider::after {
             content: '';
-            position: absolute;
-            right: 0;
-            top: 50%;
-            width: 40%;
+            flex: 1;
             height: 1px;
             background-color: #E5E5EA;
         }
         
         .date-divider span {
-            background-color: #f0f0f0;
-            padding: 0 10px;
-            position: relative;
-            z-index: 1;
             font-size: 0.9em;
             color: #8E8E93;
         }
@@ -1120,369 +1327,82 @@ def generate_html(messages, media_files, output_file):
             
             .message {
                 max-width: 85%;
-            }
-            
-            .controls-wrapper {
-                width: 80%;
-                max-width: 300px;
-            }
-            
-            .controls-wrapper.minimized {
-                transform: translateX(calc(100% * var(--direction, -1)));
-            }
-            
-            body.controls-open {
-                overflow: hidden;
-            }
-        }
-        
-        code {
-            font-family: monospace;
-            background-color: #f5f5f5;
-            padding: 2px 4px;
-            border-radius: 3px;
-        }
-    </style>
-</head>
-<body>
-    <div id="controls-wrapper" class="controls-wrapper left">
-        <div class="controls">
-            <h2>Chat Controls</h2>
-            <div>
-                <label for="self-selector">Select who you are (messages will appear on the right in green):</label>
-                <select id="self-selector">
-                    <!-- Options will be populated by JavaScript -->
-                </select>
-            </div>
-            <div class="dock-position">
-                <div class="dock-position-label">Dock Position:</div>
-                <div class="dock-buttons">
-                    <div id="dock-left" class="dock-button active">Left</div>
-                    <div id="dock-right" class="dock-button">Right</div>
-                </div>
-            </div>
-            <div class="about-section">
-                <button id="about-button" class="about-button">About WhatsApp Export</button>
-            </div>
-            <div class="visibility-controls">
-                <h3>Display Options</h3>
-                <div class="toggle-option">
-                    <label for="toggle-dialog">Show Dialog</label>
-                    <label class="switch">
-                        <input type="checkbox" id="toggle-dialog" checked>
-                        <span class="slider round"></span>
-                    </label>
-                </div>
-                <div class="toggle-option">
-                    <label for="toggle-media">Show Media</label>
-                    <label class="switch">
-                        <input type="checkbox" id="toggle-media" checked>
-                        <span class="slider round"></span>
-                    </label>
-                </div>
-            </div>
-            <div class="date-filter-controls">
-                <h3>Date Filter</h3>
-                <div class="date-range">
-                    <label for="date-from">From:</label>
-                    <input type="date" id="date-from">
-                </div>
-                <div class="date-range">
-                    <label for="date-to">To:</label>
-                    <input type="date" id="date-to">
-                </div>
-                <div class="filter-buttons">
-                    <button id="apply-date-filter" class="filter-button apply">Apply Filter</button>
-                    <button id="clear-date-filter" class="filter-button clear">Clear Filter</button>
-                </div>
-            </div>
-        </div>
-        <div id="toggle-button" class="toggle-button">↓</div>
-    </div>
-    <div class="main-content">
-        <div class="chat-container">
-"""
-
-    # Track the current date for adding date dividers
-    current_date = None
-    
-    # Assign message IDs
-    for i, msg in enumerate(messages, 1):
-        msg['message_id'] = f"{i:08d}"  # Format with leading zeros (8 digits)
-    
-    for msg in messages:
-        message_date = msg['timestamp'].date() if msg['timestamp'] else None
-        
-        # Add date divider if the date has changed
-        if message_date and message_date != current_date:
-            formatted_date = message_date.strftime('%A, %B %d, %Y')
-            html += f"""
-        <div class="date-divider">
-            <span>{formatted_date}</span>
-        </div>
-"""
-            current_date = message_date
-        
-        # Format timestamp
-        timestamp = f"{msg['date_str']}, {msg['time_str']}" if msg['date_str'] and msg['time_str'] else "Unknown time"
-        
-        # Determine message class based on type
-        if msg.get('is_system', False):
-            message_class = "system-message"
-        else:
-            # Initial class (will be updated by JavaScript)
-            message_class = "received"
-            
-        # Apply deleted message class if needed
-        if msg.get('is_deleted', False):
-            message_class += " deleted-message"
-        
-        # Start message div
-        html += f"""
-        <div class="message {message_class}">
-            <div class="message-id">Message: {msg['message_id']}</div>
-"""
-        # Add media filename if present
-        if msg['media']:
-            html += f"""            <div class="media-id">Media: {msg['media']}</div>
-"""
-
-        html += f"""            <div class="timestamp">{timestamp}</div>
-"""
-        
-        # Only add sender for non-system messages
-        if not msg.get('is_system', False):
-            html += f"""            <div class="sender">{escape(msg['sender'] or 'Unknown')}</div>
-"""
-        
-        # Format content based on type
-        if msg.get('is_deleted', False):
-            html += f"""            <div class="content">This message was deleted</div>
-"""
-        else:
-            # Apply markdown formatting to content
-            formatted_content = format_markdown(msg['content'])
-            html += f"""            <div class="content">{formatted_content}</div>
-"""
-            
-        # Add edited label if needed
-        if msg.get('is_edited', False):
-            html += """            <div class="edited-label">Edited</div>
-"""
-        
-        # Add media if attached in the message
-        if msg['media']:
-            file_extension = os.path.splitext(msg['media'])[1].lower()
-            media_path = f"media/{msg['media']}"
-            
-            if file_extension in ['.jpg', '.jpeg', '.png', '.gif']:
-                html += f"""
-            <div class="media-container">
-                <img src="{media_path}" alt="Media: {msg['media']}" onclick="openModal(this.src)">
-            </div>
-"""
-            elif file_extension in ['.mp4', '.mov', '.avi', '.3gp']:
-                html += f"""
-            <div class="media-container">
-                <video controls>
-                    <source src="{media_path}" type="video/{file_extension[1:]}">
-                    Your browser does not support the video tag.
-                </video>
-            </div>
-"""
-            else:
-                html += f"""
-            <div class="media-container">
-                <a href="{media_path}" target="_blank">View attached file: {escape(msg['media'])}</a>
-            </div>
-"""
-            # Mark this media as used
-            used_media.add(msg['media'])
-        
-        # Look for potential media files by date
-        if message_date and message_date in media_map:
-            # Find media files from this date that haven't been assigned yet
-            # This is a simple heuristic and might not always match correctly
-            for media_file in media_map[message_date][:]:  # Create a copy of the list for safe iteration
-                if media_file not in used_media:  # Only use media that hasn't been used yet
-                    file_extension = os.path.splitext(media_file)[1].lower()
-                    media_path = f"media/{media_file}"
-                    
-                    if file_extension in ['.jpg', '.jpeg', '.png', '.gif']:
-                        html += f"""
-            <div class="media-container">
-                <img src="{media_path}" alt="Media: {media_file}" onclick="openModal(this.src)">
-            </div>
-"""
-                    elif file_extension in ['.mp4', '.mov', '.avi', '.3gp']:
-                        html += f"""
-            <div class="media-container">
-                <video controls>
-                    <source src="{media_path}" type="video/{file_extension[1:]}">
-                    Your browser does not support the video tag.
-                </video>
-            </div>
-"""
-                    
-                    # Mark this media as used
-                    used_media.add(media_file)
-                    # Remove this media file from the map to avoid duplicates
-                    media_map[message_date].remove(media_file)
-                    
-                    # Only assign one media file per message unless the message already has one from its content
-                    if not msg['media']:
-                        break
-        
-        # Close message div
-        html += """
-        </div>
-"""
-    
-        # After processing all messages, gather truly unused media files
-    unused_media = []
-    for file in media_files:
-        if file not in used_media:
-            unused_media.append(file)
-    
-    if unused_media:
-        print(f"Found {len(unused_media)} unused media files that will be displayed in the 'Additional Media' section")
-        html += """
-        <div class="date-divider">
-            <span>Additional Media</span>
-        </div>
-"""
-        
-        for i, media_file in enumerate(unused_media, 1):
-            # Generate a special message ID for unused media
-            media_msg_id = f"UNUSED-{i:04d}"
-            
-            file_extension = os.path.splitext(media_file)[1].lower()
-            media_path = f"media/{media_file}"
+            }
             
-            html += f"""
-        <div class="message received">
-            <div class="message-id">Message: {media_msg_id}</div>
-            <div class="media-id">Media: {media_file}</div>
-            <div class="timestamp">Unused Media</div>
-"""
+            .controls-wrapper {
+                width: 80%;
+                max-width: 300px;
+            }
             
-            if file_extension in ['.jpg', '.jpeg', '.png', '.gif']:
-                html += f"""
-            <div class="media-container">
-                <img src="{media_path}" alt="Media: {media_file}" onclick="openModal(this.src)">
-            </div>
-"""
-            elif file_extension in ['.mp4', '.mov', '.avi', '.3gp']:
-                html += f"""
-            <div class="media-container">
-                <video controls>
-                    <source src="{media_path}" type="video/{file_extension[1:]}">
-                    Your browser does not support the video tag.
-                </video>
-            </div>
-"""
-            else:
-                html += f"""
-            <div class="media-container">
-                <a href="{media_path}" target="_blank">View file: {escape(media_file)}</a>
-            </div>
-"""
+            .controls-wrapper.minimized {
+                transform: translateX(calc(100% * var(--direction, -1)));
+            }
             
-            html += """
-        </div>
+            body.controls-open {
+                overflow: hidden;
+            }
+        }
+        
+        code {
+            font-family: monospace;
+            background-color: #f5f5f5;
+            padding: 2px 4px;
+            border-radius: 3px;
+        }
 """
-    
-    # Close main container and add JavaScript for modal functionality
-    html += """
-    </div>
-    </div>
-    
-    <!-- Image modal -->
-    <div id="imageModal" class="modal">
-        <span class="close" onclick="closeModal()">&times;</span>
-        <img class="modal-content" id="modalImg">
-    </div>
-    
-    <!-- About modal -->
-    <div id="aboutModal" class="modal about-modal">
-        <div class="about-modal-content">
-            <span class="close" onclick="closeAboutModal()">&times;</span>
-            <h2>About WhatsApp Chat Export</h2>
-            <div class="about-content">
-                <p>This viewer displays a WhatsApp chat that was exported using the "Export Chat" feature in WhatsApp. While it preserves most of the conversation, there are some important limitations to be aware of:</p>
-                
-                <h3>Limitations of WhatsApp Chat Exports</h3>
-                <ul>
-                    <li><strong>Message Replies:</strong> The export does not preserve reply context. When someone replies to a specific message, that connection is lost in the export.</li>
-                    <li><strong>Reactions:</strong> Emoji reactions to messages are not included in the export.</li>
-                    <li><strong>Media Quality:</strong> Images and videos may be compressed or reduced in quality.</li>
-                    <li><strong>Formatting:</strong> Some advanced formatting might not be preserved exactly as it appeared in WhatsApp.</li>
-                    <li><strong>Polls and Interactive Content:</strong> Polls, location sharing, and other interactive content may not export completely.</li>
-                </ul>
-                
-                <h3>What Is Preserved</h3>
-                <ul>
-                    <li>Text messages with timestamps</li>
-                    <li>Basic formatting (bold, italic, strikethrough)</li>
-                    <li>Media files (photos, videos, documents, etc.)</li>
-                    <li>System messages (when someone joined or left)</li>
-                    <li>Information about deleted messages</li>
-                </ul>
-                
-                <p>Due to these limitations, some context in conversations may be lost. This viewer attempts to present the exported chat in the most readable format possible, but cannot restore information that wasn't included in the export.</p>
-            </div>
-        </div>
-    </div>
-    
-    <script>
+
+# Page script, written next to the HTML as app.js
+_PAGE_JS = """        // Settings writes, queued and flushed to localStorage together once the current
+        // event is handled; a null value removes the key
+        const storageQueue = new Map();
+        let storageFlushScheduled = false;
+        
+        function storeSetting(key, value) {
+            storageQueue.set(key, value);
+            if (!storageFlushScheduled) {
+                storageFlushScheduled = true;
+                queueMicrotask(() => {
+                    storageQueue.forEach((queuedValue, queuedKey) => {
+                        if (queuedValue === null) {
+                            localStorage.removeItem(queuedKey);
+                        } else {
+                            localStorage.setItem(queuedKey, queuedValue);
+                        }
+                    });
+                    storageQueue.clear();
+                    storageFlushScheduled = false;
+                });
+            }
+        }
+        
         // Populate sender selector and set up message display
         document.addEventListener('DOMContentLoaded', function() {
-            // Get all unique senders
-            const senders = [];
-            const messages = document.querySelectorAll('.message:not(.system-message)');
-            
-            messages.forEach(message => {
-                const senderElement = message.querySelector('.sender');
-                if (senderElement) {
-                    const sender = senderElement.textContent;
-                    if (!senders.includes(sender)) {
-                        senders.push(sender);
-                    }
-                }
-            });
-            
-            // Populate selector
+            // Sender options are emitted sorted by the generator
             const selector = document.getElementById('self-selector');
-            senders.sort().forEach(sender => {
-                const option = document.createElement('option');
-                option.value = sender;
-                option.textContent = sender;
-                selector.appendChild(option);
-            });
+            const senders = Array.from(selector.options, option => option.value);
+            
+            // One stylesheet rule restyles every message of the selected sender
+            const selfStyle = document.createElement('style');
+            selfStyle.id = 'self-style';
+            document.head.appendChild(selfStyle);
             
             // Function to update message display based on selected sender
             function updateMessageDisplay() {
                 const selectedSender = selector.value;
                 
-                messages.forEach(message => {
-                    const senderElement = message.querySelector('.sender');
-                    if (senderElement) {
-                        const sender = senderElement.textContent;
-                        
-                        // Reset classes
-                        message.classList.remove('sent', 'received');
-                        
-                        // Apply correct class
-                        if (sender === selectedSender) {
-                            message.classList.add('sent');
-                        } else {
-                            message.classList.add('received');
-                        }
-                    }
-                });
+                selfStyle.textContent = selectedSender ? `
+                    .received[data-sender="${CSS.escape(selectedSender)}"] {
+                        align-self: flex-end;
+                        background-color: #DCF8C6;
+                        border: none;
+                        margin-left: 0;
+                        margin-right: 10px;
+                        border-bottom-left-radius: 15px;
+                        border-bottom-right-radius: 5px;
+                    }` : '';
                 
                 // Save selection to localStorage
-                localStorage.setItem('whatsapp-self-sender', selectedSender);
+                storeSetting('whatsapp-self-sender', selectedSender);
             }
             
             // Set initial selection (try to restore from localStorage)
@@ -1533,7 +1453,7 @@ def generate_html(messages, media_files, output_file):
             // Toggle controls visibility
             toggleButton.addEventListener('click', function() {
                 const isMinimized = controlsWrapper.classList.toggle('minimized');
-                localStorage.setItem('whatsapp-controls-minimized', isMinimized);
+                storeSetting('whatsapp-controls-minimized', isMinimized);
                 
                 const isRight = controlsWrapper.classList.contains('right');
                 
@@ -1555,7 +1475,7 @@ def generate_html(messages, media_files, output_file):
                 const isMinimized = controlsWrapper.classList.contains('minimized');
                 toggleButton.textContent = isMinimized ? '→' : '←';
                 
-                localStorage.setItem('whatsapp-controls-position', 'left');
+                storeSetting('whatsapp-controls-position', 'left');
             });
             
             dockRight.addEventListener('click', function() {
@@ -1567,7 +1487,7 @@ def generate_html(messages, media_files, output_file):
                 const isMinimized = controlsWrapper.classList.contains('minimized');
                 toggleButton.textContent = isMinimized ? '←' : '→';
                 
-                localStorage.setItem('whatsapp-controls-position', 'right');
+                storeSetting('whatsapp-controls-position', 'right');
             });
             
             // Initialize control panel state
@@ -1576,95 +1496,75 @@ def generate_html(messages, media_files, output_file):
             // Set up visibility toggles
             const toggleDialog = document.getElementById('toggle-dialog');
             const toggleMedia = document.getElementById('toggle-media');
+            const toggleIds = document.getElementById('toggle-ids');
+            const chatContainer = document.querySelector('.chat-container');
             
-            // Function to get the current top visible message
-            function getTopVisibleMessage() {
-                const messages = document.querySelectorAll('.message');
-                const scrollTop = window.scrollY || document.documentElement.scrollTop;
+            // Collect the messages once; their content classes are fixed by the generator
+            const allMessages = Array.from(chatContainer.getElementsByClassName('message'));
+            
+            // Per-message hide flags, parallel to allMessages: a message is hidden when
+            // its flags share a bit with the mask of the filters currently switched on
+            const DIALOG_ONLY = 1;
+            const MEDIA_ONLY = 2;
+            const DATE_FILTERED = 4;
+            const messageFlags = Uint8Array.from(allMessages, message =>
+                (message.classList.contains('has-dialog') && message.classList.contains('no-media') ? DIALOG_ONLY : 0) |
+                (message.classList.contains('has-media') && message.classList.contains('no-dialog') ? MEDIA_ONLY : 0));
+            
+            // Messages currently shown, rebuilt whenever a toggle or the date filter changes
+            let visibleMessages = allMessages;
+            
+            function refreshVisibleMessages() {
+                const hiddenMask =
+                    (chatContainer.classList.contains('dialog-hidden') ? DIALOG_ONLY : 0) |
+                    (chatContainer.classList.contains('media-hidden') ? MEDIA_ONLY : 0) |
+                    (chatContainer.classList.contains('date-filter-active') ? DATE_FILTERED : 0);
                 
-                for (const message of messages) {
-                    // Skip hidden messages
-                    if (message.classList.contains('dialog-hidden') && message.classList.contains('media-hidden')) {
-                        continue;
-                    }
-                    
-                    // Skip dialog-only messages that are hidden
-                    if (message.classList.contains('has-dialog') && !message.classList.contains('has-media') && 
-                        message.classList.contains('dialog-hidden')) {
-                        continue;
-                    }
-                    
-                    // Skip media-only messages that are hidden
-                    if (message.classList.contains('has-media') && !message.classList.contains('has-dialog') && 
-                        message.classList.contains('media-hidden')) {
-                        continue;
-                    }
-                    
-                    const rect = message.getBoundingClientRect();
-                    // Check if the message is fully visible or at least partially visible from the top
-                    if (rect.top >= 0 || (rect.top < 0 && rect.bottom > 0)) {
-                        return {
-                            element: message,
-                            topOffset: rect.top
-                        };
-                    }
-                }
-                return null;
+                visibleMessages = allMessages.filter((message, index) => (messageFlags[index] & hiddenMask) === 0);
             }
             
             // Function to restore scroll position to keep the same message visible
             function restoreScrollPosition(referenceMessage) {
                 if (referenceMessage && referenceMessage.element) {
-                    const newRect = referenceMessage.element.getBoundingClientRect();
-                    const scrollAdjustment = newRect.top - referenceMessage.topOffset;
+                    // Single layout read, then at most one write
+                    const scrollAdjustment = referenceMessage.element.getBoundingClientRect().top - referenceMessage.topOffset;
                     
-                    // Apply the scroll adjustment
-                    window.scrollBy(0, scrollAdjustment);
+                    // Apply the scroll adjustment, skipping the no-op scroll when nothing moved
+                    if (scrollAdjustment !== 0) {
+                        window.scrollBy(0, scrollAdjustment);
+                    }
                 }
             }
             
-            // Flag messages with dialog and media
-            function flagMessagesWithContent() {
-                const messages = document.querySelectorAll('.message');
-                
-                messages.forEach(message => {
-                    // Check if message has dialog content
-                    const content = message.querySelector('.content');
-                    if (content && content.textContent.trim() !== '') {
-                        message.classList.add('has-dialog');
-                    }
-                    
-                    // Check if message has media content
-                    const media = message.querySelector('.media-container');
-                    if (media) {
-                        message.classList.add('has-media');
-                    }
+            // Restore once in the next frame, however many changes were made before it;
+            // the first reference is kept since it was taken before any of them
+            let pendingReference = null;
+            
+            function scheduleRestore(referenceMessage) {
+                if (pendingReference) {
+                    return;
+                }
+                pendingReference = referenceMessage || {};
+                requestAnimationFrame(() => {
+                    restoreScrollPosition(pendingReference);
+                    pendingReference = null;
                 });
             }
             
-            // Run this once on page load
-            flagMessagesWithContent();
-            
             // Handle dialog toggle
             toggleDialog.addEventListener('change', function() {
                 // Get reference message before making changes
                 const referenceMessage = getTopVisibleMessage();
                 
                 // Toggle dialog visibility
-                const messages = document.querySelectorAll('.message.has-dialog');
-                messages.forEach(message => {
-                    if (this.checked) {
-                        message.classList.remove('dialog-hidden');
-                    } else {
-                        message.classList.add('dialog-hidden');
-                    }
-                });
+                chatContainer.classList.toggle('dialog-hidden', !this.checked);
+                refreshVisibleMessages();
                 
                 // Save state to localStorage
-                localStorage.setItem('whatsapp-dialog-visible', this.checked);
+                storeSetting('whatsapp-dialog-visible', this.checked);
                 
-                // Restore scroll position after a small delay to allow rendering
-                setTimeout(() => restoreScrollPosition(referenceMessage), 10);
+                // Restore scroll position in the next frame
+                scheduleRestore(referenceMessage);
             });
             
             // Handle media toggle
@@ -1673,20 +1573,29 @@ def generate_html(messages, media_files, output_file):
                 const referenceMessage = getTopVisibleMessage();
                 
                 // Toggle media visibility
-                const messages = document.querySelectorAll('.message.has-media');
-                messages.forEach(message => {
-                    if (this.checked) {
-                        message.classList.remove('media-hidden');
-                    } else {
-                        message.classList.add('media-hidden');
-                    }
-                });
+                chatContainer.classList.toggle('media-hidden', !this.checked);
+                refreshVisibleMessages();
+                
+                // Save state to localStorage
+                storeSetting('whatsapp-media-visible', this.checked);
+                
+                // Restore scroll position in the next frame
+                scheduleRestore(referenceMessage);
+            });
+            
+            // Handle message ID toggle
+            toggleIds.addEventListener('change', function() {
+                // Get reference message before making changes
+                const referenceMessage = getTopVisibleMessage();
+                
+                // Toggle message and media ID labels
+                document.body.classList.toggle('show-ids', this.checked);
                 
                 // Save state to localStorage
-                localStorage.setItem('whatsapp-media-visible', this.checked);
+                storeSetting('whatsapp-ids-visible', this.checked);
                 
-                // Restore scroll position after a small delay to allow rendering
-                setTimeout(() => restoreScrollPosition(referenceMessage), 10);
+                // Restore scroll position in the next frame
+                scheduleRestore(referenceMessage);
             });
             
             // Initialize visibility toggles from localStorage
@@ -1695,23 +1604,26 @@ def generate_html(messages, media_files, output_file):
                 const dialogVisible = localStorage.getItem('whatsapp-dialog-visible');
                 if (dialogVisible === 'false') {
                     toggleDialog.checked = false;
-                    document.querySelectorAll('.message.has-dialog').forEach(message => {
-                        message.classList.add('dialog-hidden');
-                    });
+                    chatContainer.classList.add('dialog-hidden');
                 }
                 
                 // Media visibility
                 const mediaVisible = localStorage.getItem('whatsapp-media-visible');
                 if (mediaVisible === 'false') {
                     toggleMedia.checked = false;
-                    document.querySelectorAll('.message.has-media').forEach(message => {
-                        message.classList.add('media-hidden');
-                    });
+                    chatContainer.classList.add('media-hidden');
+                }
+                
+                // Message ID labels (hidden unless switched on)
+                if (localStorage.getItem('whatsapp-ids-visible') === 'true') {
+                    toggleIds.checked = true;
+                    document.body.classList.add('show-ids');
                 }
             }
             
             // Initialize visibility states
             initializeVisibilityToggles();
+            refreshVisibleMessages();
             
             // Date filtering functionality
             const dateFromInput = document.getElementById('date-from');
@@ -1719,46 +1631,42 @@ def generate_html(messages, media_files, output_file):
             const applyDateFilterBtn = document.getElementById('apply-date-filter');
             const clearDateFilterBtn = document.getElementById('clear-date-filter');
             
-            // Find earliest and latest dates in the chat
-            function findDateRange() {
-                const dateDividers = document.querySelectorAll('.date-divider span');
-                let earliestDate = null;
-                let latestDate = null;
-                
-                dateDividers.forEach(divider => {
-                    const dateStr = divider.textContent.trim();
-                    const date = new Date(dateStr);
-                    
-                    if (!isNaN(date.getTime())) {
-                        if (!earliestDate || date < earliestDate) {
-                            earliestDate = date;
-                        }
-                        if (!latestDate || date > latestDate) {
-                            latestDate = date;
-                        }
+            // Day sections, with the day as seconds since the epoch (UTC-naive) from data-ts
+            // (NaN for the undated Additional Media section) and their range in allMessages
+            const days = Array.from(chatContainer.getElementsByClassName('day'), section => ({
+                element: section,
+                ts: section.dataset.ts === undefined ? NaN : Number(section.dataset.ts),
+                start: 0,
+                end: 0
+            }));
+            const dayBySection = new Map(days.map(day => [day.element, day]));
+            allMessages.forEach((message, index) => {
+                const day = dayBySection.get(message.parentNode);
+                if (day) {
+                    if (day.end === 0) {
+                        day.start = index;
                     }
-                });
-                
-                return { earliestDate, latestDate };
-            }
+                    day.end = index + 1;
+                }
+            });
+            const datedDays = days.filter(day => !isNaN(day.ts));
             
-            // Format date as YYYY-MM-DD for input field
-            function formatDateForInput(date) {
-                if (!date) return '';
-                const year = date.getFullYear();
-                const month = String(date.getMonth() + 1).padStart(2, '0');
-                const day = String(date.getDate()).padStart(2, '0');
-                return `${year}-${month}-${day}`;
+            // Convert a YYYY-MM-DD input value to a data-ts day value
+            function inputToTs(value) {
+                const parts = value.split('-');
+                return Date.UTC(Number(parts[0]), Number(parts[1]) - 1, Number(parts[2])) / 1000;
             }
             
             // Set initial date range limits
             function initializeDateFilters() {
-                const { earliestDate, latestDate } = findDateRange();
+                // Earliest and latest dates in the chat, written by the generator
+                const earliestMeta = document.querySelector('meta[name="wa-date-min"]');
+                const latestMeta = document.querySelector('meta[name="wa-date-max"]');
                 
-                if (earliestDate && latestDate) {
+                if (earliestMeta && latestMeta) {
                     // Set min/max attributes
-                    const earliestStr = formatDateForInput(earliestDate);
-                    const latestStr = formatDateForInput(latestDate);
+                    const earliestStr = earliestMeta.content;
+                    const latestStr = latestMeta.content;
                     
                     dateFromInput.min = earliestStr;
                     dateFromInput.max = latestStr;
@@ -1798,71 +1706,31 @@ def generate_html(messages, media_files, output_file):
                     return;
                 }
                 
-                // First, remove any existing date-filtered class
-                document.querySelectorAll('.date-filtered').forEach(el => {
-                    el.classList.remove('date-filtered');
-                });
-                
-                // For the end date, always add one day to make it inclusive
-                let adjustedToDate = null;
-                if (toValue) {
-                    const parts = toValue.split('-');
-                    // Create a new Date with an extra day
-                    const year = parseInt(parts[0]);
-                    const month = parseInt(parts[1]) - 1; // JavaScript months are 0-indexed
-                    const day = parseInt(parts[2]) + 1; // Add one day
-                    adjustedToDate = new Date(year, month, day);
-                }
-                
-                const fromDate = fromValue ? new Date(fromValue) : null;
-                
-                // Process date dividers
-                document.querySelectorAll('.date-divider').forEach(divider => {
-                    const dateSpan = divider.querySelector('span');
-                    const dateText = dateSpan.textContent.trim();
-                    const dividerDate = new Date(dateText);
-                    
-                    let isVisible = true;
-                    
-                    // Hide if before start date
-                    if (fromDate && dividerDate < fromDate) {
-                        isVisible = false;
-                    }
-                    
-                    // Hide if on or after adjusted end date (which is already +1 day)
-                    if (adjustedToDate && dividerDate >= adjustedToDate) {
-                        isVisible = false;
-                    }
-                    
-                    if (!isVisible) {
-                        divider.classList.add('date-filtered');
-                    }
-                });
-                
-                // Now apply filtering to messages based on their date dividers
-                let currentDateDivider = null;
-                
-                // Process elements in DOM order
-                const allElements = document.querySelectorAll('.date-divider, .message');
+                // Range bounds, converted once per apply rather than per day;
+                // the end date gets one extra day to make it inclusive
+                const fromTs = fromValue ? inputToTs(fromValue) : null;
+                const adjustedToTs = toValue ? inputToTs(toValue) + 86400 : null;
                 
-                for (const element of allElements) {
-                    if (element.classList.contains('date-divider')) {
-                        // Update current date divider reference
-                        currentDateDivider = element;
-                    } else if (element.classList.contains('message')) {
-                        // If there's a current date divider and it's filtered, filter this message too
-                        if (currentDateDivider && currentDateDivider.classList.contains('date-filtered')) {
-                            element.classList.add('date-filtered');
-                        }
+                // Mark each day section, and the flags of its messages, against the range
+                for (const day of datedDays) {
+                    // Hide if before start date, or on or after adjusted end date (which is already +1 day)
+                    const filtered = (fromTs !== null && day.ts < fromTs) ||
+                        (adjustedToTs !== null && day.ts >= adjustedToTs);
+                    day.element.classList.toggle('date-filtered', filtered);
+                    for (let index = day.start; index < day.end; index++) {
+                        messageFlags[index] = filtered ?
+                            messageFlags[index] | DATE_FILTERED : messageFlags[index] & ~DATE_FILTERED;
                     }
                 }
+                chatContainer.classList.add('date-filter-active');
+                refreshVisibleMessages();
                 
                 // Save filter state to localStorage
-                localStorage.setItem('whatsapp-date-from', fromValue);
-                localStorage.setItem('whatsapp-date-to', toValue);
+                storeSetting('whatsapp-date-from', fromValue);
+                storeSetting('whatsapp-date-to', toValue);
                 
-                // Restore scroll position after a small delay
-                setTimeout(() => restoreScrollPosition(referenceMessage), 10);
+                // Restore scroll position in the next frame
+                scheduleRestore(referenceMessage);
             }
             
             // Clear date filter
@@ -1874,60 +1742,46 @@ def generate_html(messages, media_files, output_file):
                 dateFromInput.value = '';
                 dateToInput.value = '';
                 
-                // Remove filtered class from all elements
-                document.querySelectorAll('.date-filtered').forEach(el => {
-                    el.classList.remove('date-filtered');
-                });
+                // Switch the filter off; the day marks are reset on the next apply
+                chatContainer.classList.remove('date-filter-active');
+                refreshVisibleMessages();
                 
                 // Clear localStorage
-                localStorage.removeItem('whatsapp-date-from');
-                localStorage.removeItem('whatsapp-date-to');
+                storeSetting('whatsapp-date-from', null);
+                storeSetting('whatsapp-date-to', null);
                 
-                // Restore scroll position after a small delay
-                setTimeout(() => restoreScrollPosition(referenceMessage), 10);
+                // Restore scroll position in the next frame
+                scheduleRestore(referenceMessage);
             }
             
             // Event listeners for date filter controls
             applyDateFilterBtn.addEventListener('click', applyDateFilter);
             clearDateFilterBtn.addEventListener('click', clearDateFilter);
             
-            // Update the getTopVisibleMessage function to account for date filtering
+            // Function to get the current top visible message (hidden ones are already left out of visibleMessages)
             function getTopVisibleMessage() {
-                const messages = document.querySelectorAll('.message');
-                
-                for (const message of messages) {
-                    // Skip hidden messages (content filters)
-                    if (message.classList.contains('dialog-hidden') && message.classList.contains('media-hidden')) {
-                        continue;
-                    }
-                    
-                    // Skip dialog-only messages that are hidden
-                    if (message.classList.contains('has-dialog') && !message.classList.contains('has-media') && 
-                        message.classList.contains('dialog-hidden')) {
-                        continue;
-                    }
-                    
-                    // Skip media-only messages that are hidden
-                    if (message.classList.contains('has-media') && !message.classList.contains('has-dialog') && 
-                        message.classList.contains('media-hidden')) {
-                        continue;
-                    }
-                    
-                    // Skip date-filtered messages
-                    if (message.classList.contains('date-filtered')) {
-                        continue;
-                    }
-                    
-                    const rect = message.getBoundingClientRect();
-                    // Check if the message is fully visible or at least partially visible from the top
-                    if (rect.top >= 0 || (rect.top < 0 && rect.bottom > 0)) {
-                        return {
-                            element: message,
-                            topOffset: rect.top
-                        };
+                // Visible messages are stacked in DOM order, so their bottoms only increase:
+                // binary search for the first one that still reaches into the viewport
+                let low = 0;
+                let high = visibleMessages.length;
+                while (low < high) {
+                    const middle = (low + high) >> 1;
+                    if (visibleMessages[middle].getBoundingClientRect().bottom > 0) {
+                        high = middle;
+                    } else {
+                        low = middle + 1;
                     }
                 }
-                return null;
+                
+                if (low === visibleMessages.length) {
+                    return null;
+                }
+                
+                const message = visibleMessages[low];
+                return {
+                    element: message,
+                    topOffset: message.getBoundingClientRect().top
+                };
             }
             
             // Initialize date filters
@@ -1935,13 +1789,15 @@ def generate_html(messages, media_files, output_file):
         });
         
         // Image modal functionality
+        const imageModal = document.getElementById('imageModal');
+        
         function openModal(src) {
-            document.getElementById('imageModal').style.display = 'block';
+            imageModal.style.display = 'block';
             document.getElementById('modalImg').src = src;
         }
         
         function closeModal() {
-            document.getElementById('imageModal').style.display = 'none';
+            imageModal.style.display = 'none';
         }
         
         // About modal functionality
@@ -1964,23 +1820,215 @@ def generate_html(messages, media_files, output_file):
             }
         });
         
-        // Close modals when clicking outside the content
-        window.addEventListener('click', function(event) {
-            if (event.target === aboutModal) {
+        // One delegated listener opens chat images and closes the modals, either from
+        // their close buttons or by clicking outside the content
+        document.addEventListener('click', function(event) {
+            const target = event.target;
+            if (target.matches('.media-container img')) {
+                openModal(target.src);
+            } else if (target === aboutModal || (target.matches('.close') && aboutModal.contains(target))) {
                 closeAboutModal();
-            }
-            if (event.target === document.getElementById('imageModal')) {
+            } else if (target === imageModal || (target.matches('.close') && imageModal.contains(target))) {
                 closeModal();
             }
         });
-    </script>
-</body>
-</html>
 """
+
+def write_html(messages, media_files, out):
+    """Write the HTML page for parsed messages and media files to the text stream out."""
+    # Sorted unique senders for the selector, named as in the message bubbles
+    senders_list = sorted({msg.sender or 'Unknown' for msg in messages if not msg.is_system})
+    
+    # Map media files to timestamps when possible
+    media_map = {}
+    matched_count = 0
+    unmatched_count = 0
+    
+    print("Analyzing media files for timestamp matching...")
+    for file in media_files:
+        # Try to extract date from filename (e.g., IMG-20250329-WA0001.jpg)
+        date_match = _DATE8_RE.search(file)
+        if date_match:
+            try:
+                # Convert YYYYMMDD to a date object
+                file_date = _parse_file_date(date_match.group(0))
+                media_map.setdefault(file_date, deque()).append(file)
+                matched_count += 1
+            except ValueError:
+                # If date parsing fails, add to unmatched count
+                unmatched_count += 1
+        else:
+            # No date in filename
+            unmatched_count += 1
+    
+    print(f"Media mapping results: {matched_count} files mapped to dates, {unmatched_count} files without clear date mapping")
+    
+    # Track which media files have been used in the conversation
+    used_media = set()
+    
+    # Track the current date for starting a new day section
+    current_date = None
+    
+    # Local aliases for the names looked up on every message
+    write = out.write
+    _escape = _escape_name
+    _format_markdown = format_markdown
+    _get_renderer = _MEDIA_RENDERERS.get
+    
+    # First and last day of the chat, as limits for the date filter inputs; one pass
+    # over the timestamps since a clock change can put messages out of order
+    earliest = latest = None
+    for msg in messages:
+        timestamp = msg.timestamp
+        if timestamp:
+            if earliest is None or timestamp < earliest:
+                earliest = timestamp
+            if latest is None or timestamp > latest:
+                latest = timestamp
+    date_range_meta = _DATE_RANGE_META_TEMPLATE % (
+        earliest.date().isoformat(), latest.date().isoformat()
+    ) if earliest else ''
+    
+    # Page header and sender options go out before the first message
+    write(_HTML_HEAD % date_range_meta)
+    write(''.join(_SENDER_OPTION_TEMPLATE % (sender, sender) for sender in map(_escape, senders_list)))
+    write(_HTML_CONTROLS)
+    
+    for i, msg in enumerate(messages, 1):
+        # Assign the message ID (leading zeros, 8 digits) as it is emitted
+        msg.message_id = message_id = f"{i:08d}"
+        is_system = msg.is_system
+        is_deleted = msg.is_deleted
+        media = msg.media
+        message_date = msg.timestamp.date() if msg.timestamp else None
+        
+        # Start a new day section if the date has changed
+        if message_date and message_date != current_date:
+            if current_date:
+                write(_DAY_CLOSE)
+            write(_DAY_OPEN_TEMPLATE % (
+                _DAY_TS_ATTR_TEMPLATE % ((message_date.toordinal() - _EPOCH_ORDINAL) * 86400),
+                message_date.strftime('%A, %B %d, %Y'),
+            ))
+            current_date = message_date
+        
+        # Determine message class based on type
+        if is_system:
+            message_class = "system-message"
+        else:
+            # Initial class (will be updated by JavaScript)
+            message_class = "received"
+            
+        # Apply deleted message class if needed
+        if is_deleted:
+            message_class += " deleted-message"
+        
+        # Render media first so the header knows whether the message has any
+        media_parts = []
+        media_append = media_parts.append
+        
+        # Add media if attached in the message
+        if media:
+            file_extension = _media_extension(media)
+            renderer = _get_renderer(file_extension)
+            if renderer:
+                media_append(renderer(media, file_extension))
+            else:
+                media_append(_render_file_link(media, "View attached file"))
+            # Mark this media as used
+            used_media.add(media)
+        
+        # Look for potential media files by date
+        day_media = media_map.get(message_date) if message_date else None
+        if day_media:
+            # Take media files from this date that haven't been assigned yet
+            # This is a simple heuristic and might not always match correctly
+            while day_media:
+                media_file = day_media.popleft()
+                if media_file in used_media:
+                    # Already shown elsewhere, drop it from the map
+                    continue
+                
+                file_extension = _media_extension(media_file)
+                renderer = _get_renderer(file_extension)
+                if renderer:
+                    media_append(renderer(media_file, file_extension))
+                
+                # Mark this media as used
+                used_media.add(media_file)
+                
+                # Only assign one media file per message unless the message already has one from its content
+                if not media:
+                    break
+        
+        # Content classes consumed by the visibility toggles
+        has_dialog = is_deleted or bool(msg.content.strip())
+        message_class += (" has-dialog" if has_dialog else " no-dialog") + (" has-media" if media_parts else " no-media")
+        
+        # Message header and content in one template fill
+        if is_deleted:
+            content_html = _DELETED_CONTENT
+        else:
+            # Apply markdown formatting to content
+            content_html = _CONTENT_TEMPLATE % _format_markdown(msg.content)
+        # Only add sender for non-system messages
+        sender = '' if is_system else _escape(msg.sender or 'Unknown')
+        write(_MSG_TEMPLATE % (
+            message_class,
+            message_id,
+            sender and _SENDER_ATTR_TEMPLATE % sender,
+            _MEDIA_ATTR_TEMPLATE % _escape(media) if media else '',
+            msg.timestamp_str,
+            sender and _SENDER_TEMPLATE % sender,
+            content_html,
+            _EDITED_LABEL if msg.is_edited else '',
+        ))
+        
+        out.writelines(media_parts)
+        
+        # Close message div
+        write(_MSG_CLOSE)
+    
+    if current_date:
+        write(_DAY_CLOSE)
+    
+    # After processing all messages, gather truly unused media files
+    unused_media = [file for file in media_files if file not in used_media]
+    
+    if unused_media:
+        print(f"Found {len(unused_media)} unused media files that will be displayed in the 'Additional Media' section")
+        write(_DAY_OPEN_TEMPLATE % ('', 'Additional Media'))
+        
+        for i, media_file in enumerate(unused_media, 1):
+            # Generate a special message ID for unused media
+            media_msg_id = f"UNUSED-{i:04d}"
+            
+            write(_MSG_TEMPLATE % (
+                'received no-dialog has-media', media_msg_id, '', _MEDIA_ATTR_TEMPLATE % _escape(media_file), 'Unused Media', '', '', ''
+            ))
+            
+            file_extension = _media_extension(media_file)
+            renderer = _get_renderer(file_extension)
+            if renderer:
+                write(renderer(media_file, file_extension))
+            else:
+                write(_render_file_link(media_file, "View file"))
+            
+            write(_MSG_CLOSE)
+        
+        write(_DAY_CLOSE)
+    
+    write(_HTML_FOOT)
+
+def generate_html(messages, media_files, output_file):
+    """Generate HTML file from parsed messages and media files, with its stylesheet and script alongside."""
+    output_dir = os.path.dirname(output_file)
+    for asset_name, asset_content in (('style.css', _PAGE_CSS), ('app.js', _PAGE_JS)):
+        with open(os.path.join(output_dir, asset_name), 'w', encoding='utf-8') as f:
+            f.write(asset_content)
     
-    # Write HTML to file
     with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(html)
+        write_html(messages, media_files, f)
 
 def main():
     """Main function to process WhatsApp chat archive."""
@@ -2031,24 +2079,26 @@ def main():
         print("Error: Could not find or read _chat.txt in the zip file.")
         sys.exit(1)
         
-    print(f"Successfully loaded chat file: {chat_filename} ({len(chat_content)} characters, {len(chat_content.splitlines())} lines)")
+    line_count = chat_content.count('\n') + (not chat_content.endswith('\n'))
+    print(f"Successfully loaded chat file: {chat_filename} ({len(chat_content)} characters, {line_count} lines)")
 
-    # Preprocess chat content to ensure unique timestamps
+    # Preprocess chat content to ensure unique timestamps (rebinding drops the raw copy)
     print("Preprocessing chat content to ensure unique timestamps...")
-    uniquified_chat_content = uniquify_chat_headers(chat_content)
+    chat_content = uniquify_chat_headers(chat_content)
     
-    # Save the uniquified chat file for debugging
-    uniquified_chat_path = os.path.join(output_dir, 'uniquified_chat.txt')
-    try:
-        with open(uniquified_chat_path, 'w', encoding='utf-8') as f:
-            f.write(uniquified_chat_content)
-        print(f"Saved preprocessed chat file to: {uniquified_chat_path}")
-    except Exception as e:
-        print(f"Warning: Could not save preprocessed chat file: {e}")
+    # Save the uniquified chat file for debugging when WA_DEBUG is set
+    if os.environ.get('WA_DEBUG'):
+        uniquified_chat_path = os.path.join(output_dir, 'uniquified_chat.txt')
+        try:
+            with open(uniquified_chat_path, 'w', encoding='utf-8') as f:
+                f.write(chat_content)
+            print(f"Saved preprocessed chat file to: {uniquified_chat_path}")
+        except Exception as e:
+            print(f"Warning: Could not save preprocessed chat file: {e}")
 
     # Parse the uniquified chat content
     try:
-        messages = parse_chat_line_by_line(uniquified_chat_content)
+        messages = parse_chat_line_by_line(chat_content)
         if not messages:
             print("Error: No messages found in the chat file.")
             sys.exit(1)
@@ -2056,9 +2106,9 @@ def main():
         print(f"Found {len(messages)} messages.")
         
         # Some basic stats for verification
-        system_messages = sum(1 for msg in messages if msg.get('is_system', False))
-        deleted_messages = sum(1 for msg in messages if msg.get('is_deleted', False))
-        edited_messages = sum(1 for msg in messages if msg.get('is_edited', False))
+        system_messages = sum(1 for msg in messages if msg.is_system)
+        deleted_messages = sum(1 for msg in messages if msg.is_deleted)
+        edited_messages = sum(1 for msg in messages if msg.is_edited)
         
         print(f"Message breakdown:")
         print(f"  - Regular messages: {len(messages) - system_messages}")
@@ -2067,7 +2117,7 @@ def main():
         print(f"  - Edited messages: {edited_messages}")
         
         # Get list of senders
-        senders = set(msg['sender'] for msg in messages if not msg.get('is_system', False))
+        senders = set(msg.sender for msg in messages if not msg.is_system)
         print(f"Chat participants: {', '.join(sorted(senders))}")
         
     except Exception as e: